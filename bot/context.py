@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from .menu import MenuRenderer
+from .sender import RateLimitedSender
+from .service_client import ServiceClient
+from .utils import BotConfig
+
+
+@dataclass(slots=True, frozen=True)
+class BotContext:
+    config: BotConfig
+    menu_renderer: MenuRenderer
+    service_client: ServiceClient
+    sender: RateLimitedSender
+    defaults: Dict[str, Any]
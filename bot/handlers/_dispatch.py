@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Dict
+
+from aiogram import Router
+from aiogram.types import CallbackQuery
+
+from ..context import BotContext
+from ..utils import LINK_TABLE
+from . import browser_ext, donate, help as help_handler, keys, links
+
+router = Router()
+
+CallbackHandler = Callable[[CallbackQuery, BotContext], Awaitable[None]]
+
+# Один хэш-поиск по callback.data вместо цепочки фильтров F.data == ... по роутерам
+HANDLERS: Dict[str, CallbackHandler] = {
+    "menu:keys": keys.show_keys_menu,
+    "keys:get": keys.handle_get_key,
+    "keys:qr": keys.handle_show_qr,
+    "keys:recreate": keys.handle_recreate_key,
+    "menu:help": help_handler.show_help_root,
+    "help:faq": help_handler.send_common_help,
+    "menu:browser": browser_ext.show_browser_menu,
+    **{callback_data: links.send_link for callback_data in LINK_TABLE},
+    "menu:donate": donate.show_donate,
+}
+
+
+@router.callback_query()
+async def dispatch_callback(callback: CallbackQuery, ctx: BotContext) -> None:
+    handler = HANDLERS.get(callback.data or "")
+    if handler is None:
+        await callback.answer()
+        return
+    await handler(callback, ctx)
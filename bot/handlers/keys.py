@@ -1,68 +1,76 @@
 from __future__ import annotations
 
 import asyncio
+import html
 import logging
-from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import Any, Dict
+from weakref import WeakValueDictionary
 
-from aiogram import F, Router
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import BufferedInputFile, CallbackQuery
-from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from ..service_client import NotFoundError, ServiceClient, ServiceClientError
+from ..context import BotContext
+from ..service_client import NotFoundError, ServiceClientError
 from ..utils import ensure_png_bytes
 
 logger = logging.getLogger(__name__)
-router = Router()
 
 
 class UserLockManager:
-    def __init__(self, hold_seconds: int = 7) -> None:
-        self._locks: Dict[int, asyncio.Lock] = {}
-        self._hold_seconds = hold_seconds
-
-    @asynccontextmanager
-    async def lock(self, user_id: int):
-        lock = self._locks.setdefault(user_id, asyncio.Lock())
-        await lock.acquire()
-        try:
-            yield
-        finally:
-            lock.release()
-            loop = asyncio.get_running_loop()
-            loop.call_later(self._hold_seconds, self._cleanup, user_id, lock)
+    __slots__ = ("_locks",)
+
+    def __init__(self) -> None:
+        # Лок живёт, пока на него ссылается хотя бы один владелец или ожидающий;
+        # после этого запись исчезает сама, без таймеров на каждый запрос.
+        self._locks: WeakValueDictionary[int, asyncio.Lock] = WeakValueDictionary()
 
-    def _cleanup(self, user_id: int, lock: asyncio.Lock) -> None:
-        if not lock.locked():
-            self._locks.pop(user_id, None)
+    def lock(self, user_id: int) -> asyncio.Lock:
+        """Лок пользователя; использовать как `async with manager.lock(user_id):`."""
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[user_id] = lock
+        return lock
 
 
 default_lock_manager = UserLockManager()
 
+# URI -> file_id уже загруженной в Telegram картинки с QR.
+# Пересозданный ключ получает новый URI, поэтому отдельная инвалидация не нужна.
+_QR_FILE_ID_CACHE_SIZE = 4096
+_qr_file_ids: Dict[str, str] = {}
+
+
+def _remember_qr_file_id(uri: str, file_id: str) -> None:
+    if len(_qr_file_ids) >= _QR_FILE_ID_CACHE_SIZE:
+        _qr_file_ids.pop(next(iter(_qr_file_ids)))
+    _qr_file_ids[uri] = file_id
 
-def _get_defaults(callback: CallbackQuery) -> Dict[str, int | str]:
-    defaults = getattr(callback.bot, "defaults", {}) or {}
-    return {
-        "protocol": defaults.get("protocol", "vless"),
-        "inbound_id": defaults.get("inbound_id", 1),
-    }
 
+# URI содержит «&» между параметрами — без экранирования Telegram отвергает HTML-подпись
+_KEY_TMPL = (
+    "{header}\n\n"
+    "• Статус: {status}\n"
+    "Скопируйте строку ниже для подключения:\n"
+    "<code>{uri}</code>"
+)
 
-@router.callback_query(F.data == "menu:keys")
-async def show_keys_menu(callback: CallbackQuery) -> None:
-    menu_renderer = getattr(callback.bot, "menu_renderer", None)
-    if not menu_renderer:
-        logger.error("menu_renderer is not configured")
-        await callback.answer()
-        return
+
+@lru_cache(maxsize=1024)
+def _escape_uri(uri: str) -> str:
+    return html.escape(uri, quote=False)
+
+
+async def show_keys_menu(callback: CallbackQuery, ctx: BotContext) -> None:
     if callback.message:
-        text, keyboard = menu_renderer.keys()
+        text, keyboard = ctx.menu_renderer.keys()
         await callback.message.edit_text(text, reply_markup=keyboard)
     await callback.answer()
 
 
-async def _send_key_details(callback: CallbackQuery, data: Dict[str, Any]) -> None:
+async def _send_key_details(callback: CallbackQuery, ctx: BotContext, data: Dict[str, Any]) -> None:
     delivery = data.get("delivery", {})
     client = data.get("client", {})
     uri = (
@@ -71,7 +79,6 @@ async def _send_key_details(callback: CallbackQuery, data: Dict[str, Any]) -> No
         or data.get("delivery_uri")
     )
 
-    qr_bytes = ensure_png_bytes(delivery.get("qr_png_base64"), uri)
     action = data.get("action")
     status_flag = "✅ Активен" if client.get("active") else "⛔️ Отключен"
     panel_user_id = client.get("panel_user_id") or "—"
@@ -81,44 +88,51 @@ async def _send_key_details(callback: CallbackQuery, data: Dict[str, Any]) -> No
         header = "✨ Создан новый ключ"
 
     # Текст сообщения с URI в код-блоке
-    text = (
-        f"{header}\n\n"
-        f"• Статус: {status_flag}\n"
-        "Скопируйте строку ниже для подключения:\n"
-        f"<code>{uri}</code>"
-    )
-
-    # Клавиатура без URL — только «Назад»
-    kb = InlineKeyboardBuilder()
-    kb.button(text="⬅️ Назад", callback_data="menu:keys")
-    keyboard = kb.as_markup()
+    text = _KEY_TMPL.format(header=header, status=status_flag, uri=_escape_uri(uri or ""))
 
     if callback.message:
-        await callback.message.answer_photo(
-            BufferedInputFile(qr_bytes, filename="vpn_key.png"),
-            caption=text,
-            parse_mode=ParseMode.HTML,  # HTML нужен для <code>
-            reply_markup=keyboard,
-        )
+        chat_id = callback.message.chat.id
+        photo_kwargs = {
+            "caption": text,
+            "parse_mode": ParseMode.HTML,  # HTML нужен для <code>
+            "reply_markup": ctx.menu_renderer.key_details(),
+        }
+        # Картинку для этого URI Telegram уже хранит — шлём только file_id
+        file_id = _qr_file_ids.get(uri) if uri else None
+        if file_id:
+            try:
+                await ctx.sender.send(chat_id, callback.message.answer_photo, file_id, **photo_kwargs)
+            except TelegramBadRequest:
+                _qr_file_ids.pop(uri, None)
+                file_id = None
+        if not file_id:
+            qr_bytes = await ensure_png_bytes(delivery.get("qr_png_base64"), uri)
+            sent = await ctx.sender.send(
+                chat_id,
+                callback.message.answer_photo,
+                BufferedInputFile(qr_bytes, filename="vpn_key.png"),
+                **photo_kwargs,
+            )
+            if uri and sent.photo:
+                _remember_qr_file_id(uri, sent.photo[-1].file_id)
 
     await callback.answer("Готово")
 
 
-async def _handle_service_error(callback: CallbackQuery, error: Exception) -> None:
+async def _handle_service_error(callback: CallbackQuery, ctx: BotContext, error: Exception) -> None:
     logger.exception("Service call failed", exc_info=error)
     if callback.message:
-        await callback.message.answer("Не удалось выполнить запрос. Попробуйте позже.")
+        await ctx.sender.send(
+            callback.message.chat.id,
+            callback.message.answer,
+            "Не удалось выполнить запрос. Попробуйте позже.",
+        )
     await callback.answer()
 
 
-@router.callback_query(F.data == "keys:get")
-async def handle_get_key(callback: CallbackQuery) -> None:
-    service_client: ServiceClient | None = getattr(callback.bot, "service_client", None)
-    if not service_client:
-        await _handle_service_error(callback, RuntimeError("Service client unavailable"))
-        return
-
-    defaults = _get_defaults(callback)
+async def handle_get_key(callback: CallbackQuery, ctx: BotContext) -> None:
+    service_client = ctx.service_client
+    defaults = ctx.defaults
     tg_user_id = callback.from_user.id
     tg_username = callback.from_user.username or f"user{tg_user_id}"
     email = f"{tg_username}@routex"
@@ -133,22 +147,16 @@ async def handle_get_key(callback: CallbackQuery) -> None:
             )
 
         except ServiceClientError as error:
-            await _handle_service_error(callback, error)
+            await _handle_service_error(callback, ctx, error)
             return
 
         # успешный ответ от backend
-        await _send_key_details(callback, data)
-
+        await _send_key_details(callback, ctx, data)
 
 
-@router.callback_query(F.data == "keys:qr")
-async def handle_show_qr(callback: CallbackQuery) -> None:
-    service_client: ServiceClient | None = getattr(callback.bot, "service_client", None)
-    if not service_client:
-        await _handle_service_error(callback, RuntimeError("Service client unavailable"))
-        return
-
-    defaults = _get_defaults(callback)
+async def handle_show_qr(callback: CallbackQuery, ctx: BotContext) -> None:
+    service_client = ctx.service_client
+    defaults = ctx.defaults
     tg_user_id = callback.from_user.id
 
     async with default_lock_manager.lock(tg_user_id):
@@ -162,19 +170,14 @@ async def handle_show_qr(callback: CallbackQuery) -> None:
                 inbound_id=defaults["inbound_id"],
             )
         except ServiceClientError as error:
-            await _handle_service_error(callback, error)
+            await _handle_service_error(callback, ctx, error)
             return
-        await _send_key_details(callback, data)
-
+        await _send_key_details(callback, ctx, data)
 
-@router.callback_query(F.data == "keys:recreate")
-async def handle_recreate_key(callback: CallbackQuery) -> None:
-    service_client: ServiceClient | None = getattr(callback.bot, "service_client", None)
-    if not service_client:
-        await _handle_service_error(callback, RuntimeError("Service client unavailable"))
-        return
 
-    defaults = _get_defaults(callback)
+async def handle_recreate_key(callback: CallbackQuery, ctx: BotContext) -> None:
+    service_client = ctx.service_client
+    defaults = ctx.defaults
     tg_user_id = callback.from_user.id
 
     async with default_lock_manager.lock(tg_user_id):
@@ -190,6 +193,6 @@ async def handle_recreate_key(callback: CallbackQuery) -> None:
                 inbound_id=defaults["inbound_id"],
             )
         except ServiceClientError as error:
-            await _handle_service_error(callback, error)
+            await _handle_service_error(callback, ctx, error)
             return
-        await _send_key_details(callback, data)
+        await _send_key_details(callback, ctx, data)
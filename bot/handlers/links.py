@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from aiogram.types import CallbackQuery
+
+from ..context import BotContext
+
+
+async def send_link(callback: CallbackQuery, ctx: BotContext) -> None:
+    # сюда попадаем только через HANDLERS, ключ гарантированно есть в LINK_TABLE
+    if callback.message:
+        message = ctx.config.link_messages[callback.data]
+        await ctx.sender.send(callback.message.chat.id, callback.message.answer, message)
+    await callback.answer()
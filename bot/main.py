@@ -1,38 +1,74 @@
 from __future__ import annotations
 import asyncio
 import logging
+import math
 import os
 from pathlib import Path
+from typing import Any
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 from aiogram.types import CallbackQuery, Message
 from dotenv import load_dotenv
-from .handlers import browser_ext, donate, help as help_handler, keys
+import orjson
+from .context import BotContext
+from .handlers import _dispatch
 from .menu import MenuRenderer
+from .middlewares.context import ContextMiddleware
+from .sender import RateLimitedSender
 from .service_client import ServiceClient
 from .utils import BotConfig, load_yaml_config
 
+try:
+    import uvloop
+except ImportError:  # uvloop не собирается под Windows — там работаем на стандартном цикле
+    uvloop = None
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger("bot")
 
-async def start_handler(message: Message) -> None:
-    bot = message.bot
-    menu_renderer: MenuRenderer | None = getattr(bot, "menu_renderer", None)
-    if menu_renderer:
-        text, keyboard = menu_renderer.root()
-        await message.answer(text, reply_markup=keyboard)
-    else:
-        logger.error("Menu renderer is not configured")
-
-async def back_to_root(callback: CallbackQuery) -> None:
-    menu_renderer: MenuRenderer | None = getattr(callback.bot, "menu_renderer", None)
-    if menu_renderer and callback.message:
-        text, keyboard = menu_renderer.root()
+DEFAULT_SEND_CHAT_INTERVAL = 1.0
+DEFAULT_SEND_GLOBAL_RATE = 30.0
+
+def _env_float_clamped(name: str, default: float, *, minimum: float, maximum: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        logger.warning("Ignoring non-numeric %s=%r", name, raw)
+        return default
+    if not math.isfinite(value):
+        logger.warning("Ignoring non-finite %s=%r", name, raw)
+        return default
+    return min(max(value, minimum), maximum)
+
+def _env_int_clamped(name: str, default: int, *, minimum: int, maximum: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("Ignoring non-integer %s=%r", name, raw)
+        return default
+    return min(max(value, minimum), maximum)
+
+def _orjson_dumps(value: Any) -> str:
+    # aiogram кладёт результат в поля multipart-формы, поэтому нужна строка
+    return orjson.dumps(value).decode()
+
+async def start_handler(message: Message, ctx: BotContext) -> None:
+    text, keyboard = ctx.menu_renderer.root()
+    await message.answer(text, reply_markup=keyboard)
+
+async def back_to_root(callback: CallbackQuery, ctx: BotContext) -> None:
+    if callback.message:
+        text, keyboard = ctx.menu_renderer.root()
         await callback.message.edit_text(text, reply_markup=keyboard)
-    elif not menu_renderer:
-        logger.error("Menu renderer is not configured")
     await callback.answer()
 
 async def main() -> None:
@@ -51,33 +87,47 @@ async def main() -> None:
     if not service_base or not hmac_secret:
         raise RuntimeError("Service configuration is incomplete")
 
-    timeout = float(os.getenv("HTTP_TIMEOUT_SECONDS", "20"))
+    timeout = _env_float_clamped("HTTP_TIMEOUT_SECONDS", 20.0, minimum=1.0, maximum=300.0)
+    send_chat_interval = _env_float_clamped(
+        "SEND_CHAT_INTERVAL_SECONDS", DEFAULT_SEND_CHAT_INTERVAL, minimum=0.0, maximum=10.0
+    )
+    send_global_rate = _env_float_clamped("SEND_GLOBAL_RATE", DEFAULT_SEND_GLOBAL_RATE, minimum=1.0, maximum=30.0)
+    max_concurrency = _env_int_clamped("SERVICE_MAX_CONCURRENCY", 20, minimum=1, maximum=1000)
     default_protocol = os.getenv("DEFAULT_PROTOCOL", yaml_config.defaults.get("protocol", "vless"))
     default_inbound_id = int(os.getenv("DEFAULT_INBOUND_ID", yaml_config.defaults.get("inbound_id", 1)))
 
-    bot = Bot(bot_token, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
+    # каждый запрос и ответ Bot API (включая getUpdates) проходит через JSON — отдаём его orjson
+    session = AiohttpSession(json_loads=orjson.loads, json_dumps=_orjson_dumps)
+    bot = Bot(bot_token, session=session, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
     dp = Dispatcher()
 
-    service_client = ServiceClient(service_base, hmac_secret, timeout=timeout)
+    service_client = ServiceClient(service_base, hmac_secret, timeout=timeout, max_concurrency=max_concurrency)
     menu_renderer = MenuRenderer(yaml_config)
 
-    setattr(bot, "config", yaml_config)
-    setattr(bot, "service_client", service_client)
-    setattr(bot, "menu_renderer", menu_renderer)
-    setattr(bot, "defaults", {"protocol": default_protocol, "inbound_id": default_inbound_id})
+    ctx = BotContext(
+        config=yaml_config,
+        menu_renderer=menu_renderer,
+        service_client=service_client,
+        sender=RateLimitedSender(chat_interval=send_chat_interval, global_rate=send_global_rate),
+        defaults={"protocol": default_protocol, "inbound_id": default_inbound_id},
+    )
+    context_middleware = ContextMiddleware(ctx)
+    dp.message.outer_middleware(context_middleware)
+    dp.callback_query.outer_middleware(context_middleware)
 
     dp.message.register(start_handler, CommandStart())
     dp.callback_query.register(back_to_root, F.data == "menu:root")
 
-    dp.include_router(keys.router)
-    dp.include_router(help_handler.router)
-    dp.include_router(browser_ext.router)
-    dp.include_router(donate.router)
+    dp.include_router(_dispatch.router)
 
     try:
-        await dp.start_polling(bot)
+        # каждый апдейт обрабатывается отдельной задачей: медленный ответ сервиса
+        # одному пользователю не задерживает остальные чаты
+        await dp.start_polling(bot, handle_as_tasks=True)
     finally:
         await service_client.close()
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
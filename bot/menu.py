@@ -11,8 +11,33 @@ from .utils import BotConfig
 class MenuRenderer:
     def __init__(self, config: BotConfig) -> None:
         self.config = config
+        # меню статичны для конфига — собираем один раз и дальше отдаём готовые
+        self._root = self._build_root()
+        self._keys = self._build_keys()
+        self._help_root = self._build_help_root()
+        self._browser = self._build_browser()
+        self._donate = self._build_donate()
+        self._key_details = self._build_key_details()
 
     def root(self) -> Tuple[str, InlineKeyboardMarkup]:
+        return self._root
+
+    def keys(self) -> Tuple[str, InlineKeyboardMarkup]:
+        return self._keys
+
+    def help_root(self) -> Tuple[str, InlineKeyboardMarkup]:
+        return self._help_root
+
+    def browser(self) -> Tuple[str, InlineKeyboardMarkup]:
+        return self._browser
+
+    def donate(self) -> Tuple[str, InlineKeyboardMarkup]:
+        return self._donate
+
+    def key_details(self) -> InlineKeyboardMarkup:
+        return self._key_details
+
+    def _build_root(self) -> Tuple[str, InlineKeyboardMarkup]:
         builder = InlineKeyboardBuilder()
         builder.button(text="🔑 Получить/показать ключ", callback_data="menu:keys")
         builder.button(text="❓ Помощь", callback_data="menu:help")
@@ -22,7 +47,7 @@ class MenuRenderer:
         text = "Выберите действие ⬇️"
         return text, builder.as_markup()
 
-    def keys(self) -> Tuple[str, InlineKeyboardMarkup]:
+    def _build_keys(self) -> Tuple[str, InlineKeyboardMarkup]:
         builder = InlineKeyboardBuilder()
         builder.button(text="Получить ключ", callback_data="keys:get")
         builder.button(text="🧾 QR-код", callback_data="keys:qr")
@@ -32,7 +57,7 @@ class MenuRenderer:
         text = "🔑 Управление ключом"
         return text, builder.as_markup()
 
-    def help_root(self) -> Tuple[str, InlineKeyboardMarkup]:
+    def _build_help_root(self) -> Tuple[str, InlineKeyboardMarkup]:
         builder = InlineKeyboardBuilder()
         builder.button(text="📱 Android", callback_data="help:android")
         builder.button(text="🍏 iOS", callback_data="help:ios")
@@ -43,7 +68,7 @@ class MenuRenderer:
         text = "❓ Помощь"
         return text, builder.as_markup()
 
-    def browser(self) -> Tuple[str, InlineKeyboardMarkup]:
+    def _build_browser(self) -> Tuple[str, InlineKeyboardMarkup]:
         builder = InlineKeyboardBuilder()
         builder.button(text="🔗 Ссылка на скачивание", callback_data="browser:link")
         builder.button(text="📘 Инструкция", callback_data="browser:guide")
@@ -52,7 +77,7 @@ class MenuRenderer:
         text = "🌍 Расширение для браузера"
         return text, builder.as_markup()
 
-    def donate(self) -> Tuple[str, InlineKeyboardMarkup]:
+    def _build_donate(self) -> Tuple[str, InlineKeyboardMarkup]:
         builder = InlineKeyboardBuilder()
         donate_url = self.config.links.get("donate_url")
         if donate_url:
@@ -61,3 +86,9 @@ class MenuRenderer:
         builder.adjust(1)
         text = "💖 Поддержите проект"
         return text, builder.as_markup()
+
+    def _build_key_details(self) -> InlineKeyboardMarkup:
+        # под карточкой ключа без URL — только «Назад»
+        builder = InlineKeyboardBuilder()
+        builder.button(text="⬅️ Назад", callback_data="menu:keys")
+        return builder.as_markup()
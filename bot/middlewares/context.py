@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from ..context import BotContext
+
+
+class ContextMiddleware(BaseMiddleware):
+    """Передаёт общий BotContext в хэндлеры аргументом `ctx`."""
+
+    def __init__(self, ctx: BotContext) -> None:
+        self._ctx = ctx
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        data["ctx"] = self._ctx
+        return await handler(event, data)
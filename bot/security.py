@@ -4,11 +4,14 @@ import hmac
 from hashlib import sha256
 
 
-def make_signature(secret: str, timestamp: str, nonce: str, body: bytes) -> str:
-    message = f"{timestamp}:{nonce}:".encode("utf-8") + body
-    return hmac.new(secret.encode("utf-8"), message, sha256).hexdigest()
+def make_signature(secret: str | bytes, timestamp: str, nonce: str, body: bytes) -> str:
+    key = secret.encode("utf-8") if isinstance(secret, str) else secret
+    # префикс и тело скармливаем по очереди, чтобы не копировать тело ради конкатенации
+    signature = hmac.new(key, b"%b:%b:" % (timestamp.encode("utf-8"), nonce.encode("utf-8")), sha256)
+    signature.update(body)
+    return signature.hexdigest()
 
 
-def build_signature_headers(secret: str, body: bytes, *, timestamp: str, nonce: str) -> dict[str, str]:
+def build_signature_headers(secret: str | bytes, body: bytes, *, timestamp: str, nonce: str) -> dict[str, str]:
     signature = make_signature(secret, timestamp, nonce, body)
     return {"X-Timestamp": timestamp, "X-Nonce": nonce, "X-Signature": signature}
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+T = TypeVar("T")
+
+
+class RateLimitedSender:
+    """
+    Раздаёт исходящим сообщениям слоты в пределах лимитов Telegram:
+    не чаще одного сообщения в chat_interval секунд на чат и global_rate сообщений в секунду на бота.
+    Резервирование слота — O(1), ожидание своего слота не блокирует другие чаты.
+    На RetryAfter откладывается только слот этого чата: Telegram не говорит, что лимит общий
+    на бота, а глобальная пауза из-за одного чата остановила бы ответы всем. Запрос повторяется.
+    Сетевые сбои и 5xx повторяются с экспоненциальной задержкой и джиттером,
+    чтобы повторы разных чатов не били в API одновременно; остальные ошибки
+    (Forbidden, BadRequest и т.п.) пробрасываются сразу.
+    """
+
+    _PRUNE_THRESHOLD = 10_000
+
+    def __init__(
+        self,
+        *,
+        chat_interval: float = 1.0,
+        global_rate: float = 30.0,
+        max_retries: int = 3,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+    ) -> None:
+        self._chat_interval = chat_interval
+        self._global_interval = 1.0 / global_rate
+        self._max_retries = max_retries
+        self._backoff_initial = backoff_initial
+        self._backoff_max = backoff_max
+        self._next_global = 0.0
+        self._next_chat: Dict[int, float] = {}
+
+    def _reserve_chat(self, chat_id: int) -> float:
+        now = time.monotonic()
+        if len(self._next_chat) > self._PRUNE_THRESHOLD:
+            self._next_chat = {key: value for key, value in self._next_chat.items() if value > now}
+        slot = max(now, self._next_chat.get(chat_id, 0.0))
+        self._next_chat[chat_id] = slot + self._chat_interval
+        return slot - now
+
+    def _reserve_global(self) -> float:
+        # глобальный слот берём только когда чат уже свободен: чат, отложенный на RetryAfter,
+        # не должен сдвигать общий курсор и задерживать остальных
+        now = time.monotonic()
+        slot = max(now, self._next_global)
+        self._next_global = slot + self._global_interval
+        return slot - now
+
+    async def send(self, chat_id: int, method: Callable[..., Awaitable[T]], /, *args: Any, **kwargs: Any) -> T:
+        attempt = 0
+        while True:
+            delay = self._reserve_chat(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            delay = self._reserve_global()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await method(*args, **kwargs)
+            except TelegramRetryAfter as exc:
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+                resume_at = time.monotonic() + exc.retry_after
+                self._next_chat[chat_id] = max(self._next_chat.get(chat_id, 0.0), resume_at)
+            except (TelegramNetworkError, TelegramServerError):
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+                # full jitter: равномерно в [0, min(max, initial * 2^(attempt-1))]
+                ceiling = min(self._backoff_max, self._backoff_initial * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, ceiling))
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import time
 import uuid
 from typing import Any, Dict, Optional
 
 import httpx
+import orjson
 
 from .security import build_signature_headers
 
@@ -19,9 +20,11 @@ class NotFoundError(ServiceClientError):
 
 
 class ServiceClient:
-    def __init__(self, base_url: str, secret: str, *, timeout: float = 20.0) -> None:
+    def __init__(self, base_url: str, secret: str, *, timeout: float = 20.0, max_concurrency: int = 20) -> None:
         self._client = httpx.AsyncClient(base_url=base_url, timeout=timeout)
-        self._secret = secret
+        self._secret = secret.encode("utf-8")
+        # ограничиваем число одновременных запросов к сервису со всех чатов
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
     async def close(self) -> None:
         await self._client.aclose()
@@ -37,7 +40,7 @@ class ServiceClient:
     ) -> Dict[str, Any]:
         headers: Dict[str, str] = {}
         if json_body is not None:
-            body_bytes = json.dumps(json_body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            body_bytes = orjson.dumps(json_body)
             headers["Content-Type"] = "application/json"
         else:
             body_bytes = b""
@@ -48,16 +51,17 @@ class ServiceClient:
         if idempotency_key:
             headers["Idempotency-Key"] = idempotency_key
 
-        response = await self._client.request(
-            method,
-            url,
-            params=params,
-            content=body_bytes if body_bytes else None,
-            headers=headers,
-        )
+        async with self._semaphore:
+            response = await self._client.request(
+                method,
+                url,
+                params=params,
+                content=body_bytes if body_bytes else None,
+                headers=headers,
+            )
         try:
-            data = response.json()
-        except ValueError as exc:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError as exc:
             raise ServiceClientError('Invalid JSON from service') from exc
         if response.status_code == 404:
             raise NotFoundError(data.get("error", {}).get("message", "Not found"))
@@ -1,26 +1,92 @@
 from __future__ import annotations
 
+import asyncio
 import base64
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import Any, Dict
 
 import qrcode
 import yaml
+from qrcode.image.pure import PyPNGImage
 
+# libyaml-парсер заметно быстрее чистого SafeLoader; если он не собран — откатываемся
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
+class LinkSpec:
+    """
+    Как собрать ответ на кнопку-ссылку. template всегда форматируется с {url} и {text};
+    link_suffix / text_suffix дописываются, только если ссылка / текст заданы в конфиге.
+    """
+
+    template: str
+    link_key: str
+    text_key: str = ""
+    # подставляется в template вместо {url}, если ссылка не задана
+    missing_link: str = ""
+    link_suffix: str = ""
+    text_suffix: str = ""
+
+
+_HELP_TIPS = "\n\nСоветы:\n{text}"
+
+LINK_TABLE: Dict[str, LinkSpec] = {
+    "browser:link": LinkSpec("🌍 Расширение\n{url}", "browser_ext_url"),
+    "browser:guide": LinkSpec(
+        "📘 Инструкция\n{text}",
+        "browser_ext_guide_url",
+        "browser_ext_install",
+        link_suffix="\n\nПодробности: {url}",
+    ),
+    "help:android": LinkSpec(
+        "📱 Android\n{url}", "android_client_url", "help_common", "Ссылка не настроена.", text_suffix=_HELP_TIPS
+    ),
+    "help:ios": LinkSpec(
+        "🍏 iOS\n{url}", "ios_client_url", "help_common", "Ссылка не настроена.", text_suffix=_HELP_TIPS
+    ),
+    "help:windows": LinkSpec(
+        "🖥 Windows\n{url}", "windows_client_url", "help_common", "Ссылка не настроена.", text_suffix=_HELP_TIPS
+    ),
+}
+
+
+@dataclass(slots=True, frozen=True)
 class BotConfig:
     links: Dict[str, Any]
     texts: Dict[str, Any]
     postman_mapping: Dict[str, str]
     defaults: Dict[str, Any]
+    # готовые тексты ответов, собираются один раз при загрузке конфига
+    link_messages: Dict[str, str] = field(init=False)
+    help_faq_msg: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        link_messages: Dict[str, str] = {}
+        for callback_data, spec in LINK_TABLE.items():
+            url = str(self.links.get(spec.link_key) or "")
+            text = str(self.texts.get(spec.text_key) or "") if spec.text_key else ""
+            message = spec.template.format(url=url or spec.missing_link, text=text)
+            if url and spec.link_suffix:
+                message += spec.link_suffix.format(url=url)
+            if text and spec.text_suffix:
+                message += spec.text_suffix.format(text=text)
+            link_messages[callback_data] = message
+
+        common_tips = str(self.texts.get("help_common") or "")
 
+        # dataclass заморожен — заполняем вычисляемые поля в обход __setattr__
+        object.__setattr__(self, "link_messages", link_messages)
+        object.__setattr__(self, "help_faq_msg", f"❓ Общие советы\n{common_tips.strip() or 'Советы пока не добавлены.'}")
 
+
+@lru_cache(maxsize=None)
 def load_yaml_config(path: Path) -> BotConfig:
     with path.open("r", encoding="utf-8") as fp:
-        data = yaml.safe_load(fp) or {}
+        data = yaml.load(fp, Loader=_YamlLoader) or {}
     return BotConfig(
         links=data.get("links", {}),
         texts=data.get("texts", {}),
@@ -29,19 +95,36 @@ def load_yaml_config(path: Path) -> BotConfig:
     )
 
 
-def ensure_png_bytes(qr_base64: str | None, uri: str) -> bytes:
+# URI пользователя стабилен, поэтому готовые PNG держим в LRU по URI
+_QR_CACHE_SIZE = 4096
+_qr_cache: OrderedDict[str, bytes] = OrderedDict()
+
+
+async def ensure_png_bytes(qr_base64: str | None, uri: str) -> bytes:
     if qr_base64:
-        return base64.b64decode(qr_base64)
-    qr = qrcode.QRCode(version=1, box_size=6, border=2)
+        return _decode_qr(qr_base64)
+    png = _qr_cache.get(uri)
+    if png is not None:
+        _qr_cache.move_to_end(uri)
+        return png
+    # промах кэша: растеризация и сжатие PNG уходят в пул потоков, цикл событий не блокируется
+    png = await asyncio.to_thread(_render_qr, uri)
+    _qr_cache[uri] = png
+    if len(_qr_cache) > _QR_CACHE_SIZE:
+        _qr_cache.popitem(last=False)
+    return png
+
+
+@lru_cache(maxsize=256)
+def _decode_qr(qr_base64: str) -> bytes:
+    return base64.b64decode(qr_base64)
+
+
+def _render_qr(uri: str) -> bytes:
+    qr = qrcode.QRCode(version=1, box_size=6, border=2, image_factory=PyPNGImage)
     qr.add_data(uri)
     qr.make(fit=True)
-    image = qr.make_image(fill_color="black", back_color="white")
     buffer = BytesIO()
-    try:
-        # для PIL-рендерера
-        image.save(buffer, format="PNG")
-    except TypeError:
-        # для PyPNG-рендерера (не принимает параметр "format")
-        image.save(buffer)
-    buffer.seek(0)
-    return buffer.read()
+    # PyPNG пишет PNG сразу в поток, без PIL и без выбора формата
+    qr.make_image().save(buffer)
+    return buffer.getvalue()
@@ -3,20 +3,22 @@ from __future__ import annotations
 
 import logging
 import os
-import json
+import time
 import uuid as uuidlib
 from urllib.parse import quote
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Type, TypeVar
 from contextlib import asynccontextmanager
 
+import httpx
+import orjson
 import yaml
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, Field, ValidationError
 
-from .xui_client import XuiClient, XuiNotFound, XuiBadResponse
+from .xui_client import DEFAULT_LIMITS, XuiClient, XuiNotFound, XuiBadResponse
 from .idempotency import IdempotencyCache
 from .mapping import MappingError, normalize_key_payload, normalize_revoke_payload, normalize_status_payload
 from .postman_runner import PostmanRunner
@@ -66,18 +68,22 @@ class ServiceSettings(BaseModel):
 with (CONFIG_DIR / "config.yaml").open("r", encoding="utf-8") as fp:
     yaml_config = yaml.safe_load(fp) or {}
 
-settings = ServiceSettings(
+# Значения приводим к нужным типам сами, поэтому валидацию pydantic пропускаем
+settings = ServiceSettings.model_construct(
     host=os.getenv("SERVICE_HOST", "0.0.0.0"),
     port=int(os.getenv("SERVICE_PORT", "8080")),
     hmac_secret=os.getenv("SERVICE_HMAC_SECRET", ""),
     timeout=float(os.getenv("HTTP_TIMEOUT_SECONDS", yaml_config.get("timeout", 20))),
-    postman_mapping=yaml_config.get("postman_mapping", {}),
-    defaults=yaml_config.get("defaults", {}),
+    postman_mapping=dict(yaml_config.get("postman_mapping") or {}),
+    defaults=dict(yaml_config.get("defaults") or {}),
 )
 
 if not settings.hmac_secret:
     raise RuntimeError("SERVICE_HMAC_SECRET must be set")
 
+# секрет не меняется — кодируем один раз, а не на каждый подписанный запрос
+HMAC_SECRET_BYTES = settings.hmac_secret.encode("utf-8")
+
 collection_path = CONFIG_DIR / "postman.collection.json"
 environment_path = CONFIG_DIR / "postman.environment.json"
 
@@ -85,14 +91,14 @@ environment_path = CONFIG_DIR / "postman.environment.json"
 
 app_exception_logger = logging.getLogger("service.exceptions")
 
-async def service_error_handler(_: Request, exc: ServiceError) -> JSONResponse:
-    return JSONResponse(
+async def service_error_handler(_: Request, exc: ServiceError) -> ORJSONResponse:
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"status": "error", "error": {"code": exc.code, "message": exc.message}},
     )
 
 
-async def http_exception_handler(_: Request, exc: HTTPException) -> JSONResponse:
+async def http_exception_handler(_: Request, exc: HTTPException) -> ORJSONResponse:
     detail = exc.detail or {}
     if isinstance(detail, dict):
         code = detail.get("code", "http_error")
@@ -100,7 +106,7 @@ async def http_exception_handler(_: Request, exc: HTTPException) -> JSONResponse
     else:
         code = "http_error"
         message = str(detail)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"status": "error", "error": {"code": code, "message": message}},
     )
@@ -108,53 +114,47 @@ async def http_exception_handler(_: Request, exc: HTTPException) -> JSONResponse
 
 # FastAPI создадим ниже (после описания lifespan); хэндлеры регистрируем после app = FastAPI(...)
 
+# Самые большие легитимные тела (issue/revoke) — пара сотен байт
+MAX_BODY_BYTES = 64 * 1024
+
+
 async def hmac_guard(request: Request) -> None:
-    body = await request.body()
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > MAX_BODY_BYTES:
+        raise ServiceError(413, "payload_too_large", f"Request body exceeds {MAX_BODY_BYTES} bytes")
+    # chunked-запрос без Content-Length считаем по мере чтения и обрываем на первом лишнем куске,
+    # не дочитывая загрузку в память
+    chunks: list[bytes] = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > MAX_BODY_BYTES:
+            raise ServiceError(413, "payload_too_large", f"Request body exceeds {MAX_BODY_BYTES} bytes")
+        chunks.append(chunk)
+    body = b"".join(chunks)
     try:
-        verify_hmac(request.headers, body, secret=settings.hmac_secret)
+        verify_hmac(request.headers, body, secret=HMAC_SECRET_BYTES)
     except SignatureError as exc:
         raise ServiceError(401, "unauthorized", str(exc)) from exc
+    # роуты разбирают уже прочитанные и проверенные байты, см. _parse_body
+    request.state.body = body
 
 
-def _extract_clients_from_inbound(payload: dict) -> list[dict]:
-    """
-    В 3x-ui клиенты лежат в obj.settings.clients[], а obj.settings приходит строкой JSON.
-    Поддерживаем разные формы ответа (fork-и иногда заворачивают в data/obj).
-    """
-    candidates = [
-        payload,
-        payload.get("data") or {},
-        (payload.get("data") or {}).get("obj") or {},
-        payload.get("obj") or {},
-    ]
-    obj = {}
-    for c in candidates:
-        if isinstance(c, dict) and "settings" in c:
-            obj = c
-            break
-    settings_raw = obj.get("settings")
-    if settings_raw is None:
-        return []
-    if isinstance(settings_raw, str):
-        try:
-            settings_parsed = json.loads(settings_raw)
-        except Exception:
-            return []
-    elif isinstance(settings_raw, dict):
-        settings_parsed = settings_raw
-    else:
-        return []
-    clients = settings_parsed.get("clients") or []
-    return clients if isinstance(clients, list) else []
+ModelT = TypeVar("ModelT", bound=BaseModel)
 
 
-def _find_client_uuid(clients: list[dict], email: str) -> str | None:
-    for c in clients:
-        if isinstance(c, dict) and str(c.get("email", "")).lower() == email.lower():
-            cid = c.get("id")
-            if isinstance(cid, str) and len(cid) >= 8:
-                return cid
-    return None
+def _parse_body(request: Request, model: Type[ModelT]) -> ModelT:
+    """
+    Разбор тела одним проходом model_validate_json вместо body-параметра FastAPI
+    (json -> dict -> модель). Вызывать только в роутах под hmac_guard.
+    """
+    try:
+        return model.model_validate_json(request.state.body)
+    except ValidationError as exc:
+        message = "; ".join(
+            f"{'.'.join(map(str, err['loc'])) or 'body'}: {err['msg']}" for err in exc.errors()
+        )
+        raise ServiceError(422, "validation_error", message) from exc
 
 
 def _merge_client_into_settings(inbound_payload: dict, new_client: dict) -> dict:
@@ -166,7 +166,7 @@ def _merge_client_into_settings(inbound_payload: dict, new_client: dict) -> dict
     settings_raw = obj.get("settings")
     if isinstance(settings_raw, str):
         try:
-            s = json.loads(settings_raw)
+            s = orjson.loads(settings_raw)
         except Exception:
             s = {}
     elif isinstance(settings_raw, dict):
@@ -175,29 +175,35 @@ def _merge_client_into_settings(inbound_payload: dict, new_client: dict) -> dict
         s = {}
 
     clients_list = s.get("clients") or []
-    if not isinstance(clients_list, list):
-        clients_list = []
+    # копия: исходный payload может лежать в кэше инбаундов XuiClient
+    clients_list = list(clients_list) if isinstance(clients_list, list) else []
 
     # если такой email уже есть — заменим id, иначе добавим
-    replaced = False
-    for i, c in enumerate(clients_list):
-        if isinstance(c, dict) and str(c.get("email", "")).lower() == str(new_client.get("email", "")).lower():
-            clients_list[i] = new_client
-            replaced = True
-            break
-    if not replaced:
+    new_email = str(new_client.get("email", "")).lower()
+    position = next(
+        (
+            i
+            for i, c in enumerate(clients_list)
+            if isinstance(c, dict) and str(c.get("email", "")).lower() == new_email
+        ),
+        None,
+    )
+    if position is None:
         clients_list.append(new_client)
+    else:
+        clients_list[position] = new_client
 
     s["clients"] = clients_list
     return s
 
 
-def _build_vless_uri(host: str, uuid: str, email: str, defaults: dict) -> str:
+def _vless_uri_suffix(defaults: dict) -> str:
     """
+    Неизменная часть VLESS-ссылки: всё от «@» до «#».
     vless://<UUID>@HOST:PORT?type=tcp&encryption=none&security=reality
       &pbk=...&fp=chrome&sni=...&sid=...&spx=%2F#<email_urlencoded>
     """
-    vless_host = host or defaults.get("public_host") or "185.254.190.58"
+    vless_host = defaults.get("public_host") or "185.254.190.58"
     vless_port = int(defaults.get("vless_port") or 443)
     pbk = defaults.get("reality_pbk") or "z5DopT_JthDMuQYIlrnttFTc2hlFmJd1Tkq6bhH7niE"
     sni = defaults.get("reality_sni") or "www.googletagmanager.com"
@@ -209,7 +215,20 @@ def _build_vless_uri(host: str, uuid: str, email: str, defaults: dict) -> str:
         "type=tcp&encryption=none&security=reality"
         f"&pbk={pbk}&fp={fp}&sni={sni}&sid={sid}&spx=%2F"
     )
-    return f"vless://{uuid}@{vless_host}:{vless_port}?{query}#{quote(email, safe='')}"
+    return f"@{vless_host}:{vless_port}?{query}"
+
+
+# defaults читаются один раз при старте — собираем хвост ссылки заранее
+_VLESS_URI_SUFFIX = _vless_uri_suffix(settings.defaults)
+
+
+def _build_vless_uri(uuid: str, email: str) -> str:
+    return f"vless://{uuid}{_VLESS_URI_SUFFIX}#{quote(email, safe='')}"
+
+def _response_json(response: Any) -> Any:
+    """Тело ответа PostmanRunner через orjson — по сырым байтам, без декодирования текста httpx."""
+    return orjson.loads(response.content)
+
 
 # ====== Унифицированный обработчик ошибок панели ======
 async def handle_panel_error(response: Any) -> None:
@@ -218,7 +237,7 @@ async def handle_panel_error(response: Any) -> None:
     Ставит код панели в наш формат {"status":"error","error":{...}}.
     """
     try:
-        payload = response.json()
+        payload = _response_json(response)
     except Exception:
         payload = {}
     message = payload.get("error") if isinstance(payload, dict) else None
@@ -227,24 +246,29 @@ async def handle_panel_error(response: Any) -> None:
 
 # ====== Инициализация (lifespan) и DI ======
 
-def _build_xui() -> XuiClient:
+def _build_xui(client: httpx.AsyncClient) -> XuiClient:
     base = os.getenv("XUI_BASE_URL", "http://127.0.0.1:54321")
     user = os.getenv("XUI_USERNAME")
     pwd = os.getenv("XUI_PASSWORD")
     pref = os.getenv("XUI_API_PREFIX", "/panel/api")
     if not (user and pwd):
         raise RuntimeError("XUI_USERNAME/XUI_PASSWORD must be set in .env")
-    return XuiClient(base, user, pwd, api_prefix=pref, timeout=10.0)
+    return XuiClient(base, user, pwd, api_prefix=pref, timeout=10.0, client=client)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.idempotency_cache = IdempotencyCache(ttl_seconds=300)
+    app.state.health_memo = (0.0, b"")
+
+    # Оба клиента ходят в одну и ту же панель — один пул соединений и один cookie-jar на двоих.
+    # Таймауты каждый передаёт в своих запросах.
+    http_client = httpx.AsyncClient(follow_redirects=False, limits=DEFAULT_LIMITS)
 
     # 1) XuiClient (обязателен)
     xui_client: Optional[XuiClient] = None
     try:
-        xui_client = _build_xui()
+        xui_client = _build_xui(http_client)
         await xui_client.login()
     except Exception as exc:  # noqa: BLE001 - хотим отлавливать любые ошибки старта
         logger.warning("XUI client disabled", extra={"reason": str(exc)})
@@ -259,6 +283,7 @@ async def lifespan(app: FastAPI):
                 collection_path,
                 environment_path=environment_path if environment_path.exists() else None,
                 timeout=settings.timeout,
+                client=http_client,
             )
             logger.info("Postman runner initialized", extra={"collection": str(collection_path)})
         except Exception:
@@ -275,20 +300,30 @@ async def lifespan(app: FastAPI):
         xui_from_state: Optional[XuiClient] = getattr(app.state, "xui", None)
         if xui_from_state:
             await xui_from_state.aclose()
+        await http_client.aclose()
 
 
-app = FastAPI(title="VPN Service Adapter", lifespan=lifespan)
+app = FastAPI(title="VPN Service Adapter", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # значения по умолчанию, если lifespan не успел выполниться
 app.state.idempotency_cache = IdempotencyCache(ttl_seconds=300)
 app.state.postman_runner = None
 app.state.xui = None
+# (истекает по monotonic, тело ответа) последней проверки панели для /health
+app.state.health_memo = (0.0, b"")
 
 # регистрируем exception handlers
 app.add_exception_handler(ServiceError, service_error_handler)
 app.add_exception_handler(HTTPException, http_exception_handler)
 
 
+def _invalidate_inbound_cache(inbound_id: Any) -> None:
+    """PostmanRunner меняет клиентов в обход XuiClient — его кэш инбаунда после этого врёт."""
+    xui: Optional[XuiClient] = getattr(app.state, "xui", None)
+    if xui and inbound_id:
+        xui.invalidate_inbound(int(inbound_id))
+
+
 def get_runner() -> PostmanRunner:
     runner: Optional[PostmanRunner] = getattr(app.state, "postman_runner", None)
     if runner is None:
@@ -298,16 +333,28 @@ def get_runner() -> PostmanRunner:
 
 # ====== Роуты ======
 
+# Пробы дёргают /health часто, а проверка ходит в панель за полным списком инбаундов:
+# результат проверки держим несколько секунд, тела ответов собраны заранее.
+HEALTH_PROBE_TTL = 5.0
+_HEALTH_OK = b'{"status":"ok","xui":"up"}'
+_HEALTH_NOT_CONFIGURED = b'{"status":"degraded","xui":"not_configured"}'
+
+
 @app.get("/health")
-async def healthcheck() -> dict[str, str]:
+async def healthcheck() -> Response:
     xui: Optional[XuiClient] = getattr(app.state, "xui", None)
     if not xui:
-        return {"status": "degraded", "xui": "not_configured"}
-    try:
-        _ = await xui.list_inbounds()
-        return {"status": "ok", "xui": "up"}
-    except Exception as e:
-        return {"status": "degraded", "xui": f"error: {e!s}"}
+        return Response(content=_HEALTH_NOT_CONFIGURED, media_type="application/json")
+    expires_at, body = app.state.health_memo
+    now = time.monotonic()
+    if now >= expires_at:
+        try:
+            _ = await xui.list_inbounds()
+            body = _HEALTH_OK
+        except Exception as e:
+            body = orjson.dumps({"status": "degraded", "xui": f"error: {e!s}"})
+        app.state.health_memo = (now + HEALTH_PROBE_TTL, body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/api/v1/keys/by-user", dependencies=[Depends(hmac_guard)])
@@ -317,7 +364,7 @@ async def get_key_by_user(
     inbound_id: int | None = None,
     email: str | None = None,
     nickname: str | None = None,
-) -> Dict[str, Any]:
+) -> ORJSONResponse:
     """
     1) GET /panel/api/inbounds/get/:inbound_id — читаем клиентов
     2) Ищем по email (или nickname@routex)
@@ -336,17 +383,29 @@ async def get_key_by_user(
         if not xui_client:
             raise ServiceError(503, "service_unavailable", "XUI client is not configured")
 
+        # проверка и чтение идут без await между ними, так что ответ точно придёт оттуда же
+        from_cache = xui_client.has_cached_inbound(int(inbound_id))
         try:
-            inbound_payload = await xui_client.get_inbound(int(inbound_id))
+            inbound_payload, client_index = await xui_client.get_inbound_with_index(int(inbound_id))
         except XuiNotFound:
             raise ServiceError(404, "not_found", "Inbound not found")
         except (XuiBadResponse, Exception) as e:
             raise ServiceError(502, "panel_error", f"Failed to read inbound: {e!s}")
 
-        clients = _extract_clients_from_inbound(inbound_payload)
-        uuid = _find_client_uuid(clients, user_email)
+        uuid = client_index.get(user_email)
         action = "existing"
 
+        if not uuid and from_cache:
+            # ответ из кэша: перед записью settings перечитываем инбаунд,
+            # иначе затрём клиентов, добавленных за время жизни кэша
+            try:
+                inbound_payload, client_index = await xui_client.get_inbound_with_index(int(inbound_id), fresh=True)
+            except XuiNotFound:
+                raise ServiceError(404, "not_found", "Inbound not found")
+            except (XuiBadResponse, Exception) as e:
+                raise ServiceError(502, "panel_error", f"Failed to read inbound: {e!s}")
+            uuid = client_index.get(user_email)
+
         if not uuid:
             new_uuid = str(uuidlib.uuid4())
             new_client = {"id": new_uuid, "email": user_email}
@@ -358,17 +417,16 @@ async def get_key_by_user(
                 raise ServiceError(502, "panel_error", f"Failed to update inbound settings: {e!s}")
 
             try:
-                reread_payload = await xui_client.get_inbound(int(inbound_id))
+                _, client_index = await xui_client.get_inbound_with_index(int(inbound_id), fresh=True)
             except (XuiNotFound, XuiBadResponse, Exception) as e:
                 raise ServiceError(502, "panel_error", f"Failed to reread inbound: {e!s}")
 
-            clients2 = _extract_clients_from_inbound(reread_payload)
-            uuid = _find_client_uuid(clients2, user_email)
+            uuid = client_index.get(user_email)
             if not uuid:
                 raise ServiceError(502, "panel_error", "Client was created but not found on reread")
             action = "created"
 
-        delivery_uri = _build_vless_uri(settings.defaults.get("public_host"), uuid, user_email, settings.defaults)
+        delivery_uri = _build_vless_uri(uuid, user_email)
         raw_payload = {
             "data": {
                 "email": user_email,
@@ -387,7 +445,7 @@ async def get_key_by_user(
             )
             normalized = {"client": {}, "delivery": None, "raw": raw_payload}
 
-        return {"status": "ok", "action": action, **normalized}
+        return ORJSONResponse(content={"status": "ok", "action": action, **normalized})
 
     # Иначе — старый режим через Postman коллекцию
     if tg_user_id is None:
@@ -407,7 +465,7 @@ async def get_key_by_user(
     if response.status_code >= 400:
         await handle_panel_error(response)
 
-    base_payload = response.json()
+    base_payload = _response_json(response)
     try:
         normalized = normalize_key_payload(base_payload)
     except MappingError as exc:
@@ -417,26 +475,27 @@ async def get_key_by_user(
         )
         normalized = {"client": {}, "delivery": None, "raw": base_payload}
 
-    return {"status": "ok", "action": "existing", **normalized}
+    return ORJSONResponse(content={"status": "ok", "action": "existing", **normalized})
 
 
 # — Остальные эндпоинты остаются на PostmanRunner (как у тебя было)
 
 @app.post("/api/v1/keys/issue", dependencies=[Depends(hmac_guard)])
-async def issue_key(request: Request, payload: IssueRequest) -> JSONResponse:
+async def issue_key(request: Request) -> ORJSONResponse:
     idempotency_key = request.headers.get("Idempotency-Key")
     if not idempotency_key:
         raise ServiceError(400, "missing_idempotency_key", "Idempotency-Key header is required")
 
+    # Повтор отдаём до разбора тела. Подпись при этом уже проверена hmac_guard:
+    # без неё кэш выдавал бы чужой ключ любому, кто знает Idempotency-Key.
     cache: IdempotencyCache = app.state.idempotency_cache
     cached = await cache.get(idempotency_key)
     if cached:
         status_code, content = cached
-        logger.info(
-            "idempotent_cache_hit",
-            extra={"idempotency_key": idempotency_key, "tg_user_id": payload.tg_user_id},
-        )
-        return JSONResponse(status_code=status_code, content=content)
+        logger.info("idempotent_cache_hit", extra={"idempotency_key": idempotency_key})
+        return ORJSONResponse(status_code=status_code, content=content)
+
+    payload = _parse_body(request, IssueRequest)
 
     runner = get_runner()
     mapping_find = settings.postman_mapping.get("find_by_user")
@@ -464,13 +523,14 @@ async def issue_key(request: Request, payload: IssueRequest) -> JSONResponse:
             mapping_create,
             json_body=create_payload,
         )
+        _invalidate_inbound_cache(inbound_id)
         if create_response.status_code >= 400:
             await handle_panel_error(create_response)
-        base_payload = create_response.json()
+        base_payload = _response_json(create_response)
     elif find_response.status_code >= 400:
         await handle_panel_error(find_response)
     else:
-        base_payload = find_response.json()
+        base_payload = _response_json(find_response)
 
     try:
         normalized = normalize_key_payload(base_payload)
@@ -485,11 +545,12 @@ async def issue_key(request: Request, payload: IssueRequest) -> JSONResponse:
         "issue_key_success",
         extra={"tg_user_id": payload.tg_user_id, "action": action, "inbound_id": inbound_id},
     )
-    return JSONResponse(status_code=200, content=content)
+    return ORJSONResponse(status_code=200, content=content)
 
 
 @app.post("/api/v1/keys/revoke", dependencies=[Depends(hmac_guard)])
-async def revoke_key(payload: RevokeRequest) -> Dict[str, Any]:
+async def revoke_key(request: Request) -> ORJSONResponse:
+    payload = _parse_body(request, RevokeRequest)
     runner = get_runner()
     mapping_name = settings.postman_mapping.get("revoke_by_user")
     if not mapping_name:
@@ -499,16 +560,17 @@ async def revoke_key(payload: RevokeRequest) -> Dict[str, Any]:
         mapping_name,
         json_body={"tg_user_id": payload.tg_user_id, "inbound_id": payload.inbound_id, "reason": payload.reason},
     )
+    _invalidate_inbound_cache(payload.inbound_id)
     if response.status_code >= 400:
         await handle_panel_error(response)
 
-    normalized = normalize_revoke_payload(response.json())
+    normalized = normalize_revoke_payload(_response_json(response))
     logger.info("revoke_success", extra={"tg_user_id": payload.tg_user_id, "inbound_id": payload.inbound_id})
-    return {"status": "ok", **normalized}
+    return ORJSONResponse(content={"status": "ok", **normalized})
 
 
 @app.get("/api/v1/status", dependencies=[Depends(hmac_guard)])
-async def status(tg_user_id: int) -> Dict[str, Any]:
+async def status(tg_user_id: int) -> ORJSONResponse:
     runner = get_runner()
     mapping_name = settings.postman_mapping.get("status_by_user")
     if not mapping_name:
@@ -518,6 +580,6 @@ async def status(tg_user_id: int) -> Dict[str, Any]:
         if response.status_code == 404:
             raise ServiceError(404, "not_found", "Client not found")
         await handle_panel_error(response)
-    normalized = normalize_status_payload(response.json())
+    normalized = normalize_status_payload(_response_json(response))
     logger.info("status_lookup", extra={"tg_user_id": tg_user_id, "active": normalized["active"]})
-    return {"status": "ok", **normalized}
+    return ORJSONResponse(content={"status": "ok", **normalized})
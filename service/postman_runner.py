@@ -1,15 +1,22 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
 import re
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, Iterable, Mapping, Optional
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+from urllib.parse import quote, urlencode
 
 import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# {{VAR}} из environment и :param / {param} в пути
+_ENV_RE = re.compile(r"\{\{([^{}]+)\}\}")
+_PATH_RE = re.compile(r"[:{](\w+)\}?")
+
 
 def _extract_items(items: Iterable[Mapping[str, Any]]) -> Dict[str, Mapping[str, Any]]:
     flattened: Dict[str, Mapping[str, Any]] = {}
@@ -23,6 +30,25 @@ def _extract_items(items: Iterable[Mapping[str, Any]]) -> Dict[str, Mapping[str,
     return flattened
 
 
+@dataclass(slots=True, frozen=True)
+class CompiledRequest:
+    """Запрос из коллекции, разобранный один раз при старте."""
+
+    method: str
+    # URL с уже подставленными {{VAR}} из environment; пустой — URL в коллекции не задан
+    url_template: str
+    headers: Tuple[Tuple[str, str], ...]
+
+
+def _raw_url(request_def: Mapping[str, Any]) -> str:
+    url_info = request_def.get("url")
+    if isinstance(url_info, str):
+        return url_info
+    if isinstance(url_info, Mapping):
+        return url_info.get("raw", "")
+    return ""
+
+
 class PostmanRunner:
     def __init__(
         self,
@@ -30,46 +56,62 @@ class PostmanRunner:
         *,
         environment_path: Optional[Path] = None,
         timeout: float = 20.0,
+        client: Optional[httpx.AsyncClient] = None,
     ) -> None:
         if not collection_path.exists():
             raise FileNotFoundError(f"Postman collection not found: {collection_path}")
-        with collection_path.open("r", encoding="utf-8") as fp:
-            data = json.load(fp)
-        self._requests = _extract_items(data.get("item", []))
+        data = orjson.loads(collection_path.read_bytes())
+        items = _extract_items(data.get("item", []))
 
         self._env: Dict[str, str] = {}
         if environment_path and environment_path.exists():
-            with environment_path.open("r", encoding="utf-8") as fp:
-                env_data = json.load(fp)
+            env_data = orjson.loads(environment_path.read_bytes())
             for value in env_data.get("values", []):
                 if value.get("enabled", True):
                     self._env[value["key"]] = value.get("value", "")
 
+        # environment не меняется после старта — метод, URL и заголовки готовим один раз
+        self._requests: Dict[str, CompiledRequest] = {
+            name: self._compile(item.get("request", {})) for name, item in items.items()
+        }
+
         self._timeout = timeout
-        self._client = httpx.AsyncClient(timeout=timeout)
+        # общий с XuiClient клиент закрывает владелец (lifespan приложения)
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(timeout=timeout)
         self._logged_in = False
+        self._login_lock = asyncio.Lock()
+        self._login_generation = 0
 
     async def aclose(self) -> None:
-        await self._client.aclose()
-
-    async def _login(self) -> None:
-        # Требуются переменные окружения в postman.environment.json: HOST, PORT, USER, PASS
-        host = self._env.get("HOST")
-        port = self._env.get("PORT")
-        user = self._env.get("USER") or self._env.get("USERNAME")
-        pwd  = self._env.get("PASS") or self._env.get("PASSWORD")
-        if not (host and port and user and pwd):
-            # Нечего логинить — пропустим
-            self._logged_in = False
-            return
-        url = f"http://{host}:{port}/login"
-        try:
-            resp = await self._client.post(url, json={"username": user, "password": pwd})
-            # Успех — 200/204/302/307 — кука сохранится в self._client.cookies
-            self._logged_in = resp.status_code < 400
-        except Exception:
-            self._logged_in = False
-    
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def _login(self, stale_generation: Optional[int] = None) -> None:
+        async with self._login_lock:
+            # пока ждали лок, другой вызов уже перелогинился — повторять не нужно
+            if stale_generation is not None and stale_generation != self._login_generation:
+                return
+            self._login_generation += 1
+            # Требуются переменные окружения в postman.environment.json: HOST, PORT, USER, PASS
+            host = self._env.get("HOST")
+            port = self._env.get("PORT")
+            user = self._env.get("USER") or self._env.get("USERNAME")
+            pwd  = self._env.get("PASS") or self._env.get("PASSWORD")
+            if not (host and port and user and pwd):
+                # Нечего логинить — пропустим
+                self._logged_in = False
+                return
+            url = f"http://{host}:{port}/login"
+            try:
+                resp = await self._client.post(
+                    url, json={"username": user, "password": pwd}, timeout=self._timeout
+                )
+                # Успех — 200/204/302/307 — кука сохранится в self._client.cookies
+                self._logged_in = resp.status_code < 400
+            except Exception:
+                self._logged_in = False
+
     async def call(
         self,
         name: str,
@@ -79,61 +121,76 @@ class PostmanRunner:
         json_body: Optional[Mapping[str, Any]] = None,
         extra_headers: Optional[Mapping[str, str]] = None,
     ) -> httpx.Response:
-        if name not in self._requests:
+        compiled = self._requests.get(name)
+        if compiled is None:
             raise KeyError(f"Request '{name}' not found in Postman collection")
-
-        request_def = self._requests[name]["request"]
-        method = request_def.get("method", "GET")
-        url_info = request_def.get("url")
-        if isinstance(url_info, str):
-            raw_url = url_info
-        else:
-            raw_url = url_info.get("raw", "")
-        if not raw_url:
+        if not compiled.url_template:
             raise ValueError(f"Request '{name}' is missing URL definition")
 
-        url = self._prepare_url(raw_url, path_params or {}, query or {})
+        method = compiled.method
+        url = self._prepare_url(compiled.url_template, path_params or {}, query or {})
 
-        headers = {header["key"]: header.get("value", "") for header in request_def.get("header", []) if header.get("key")}
+        headers = dict(compiled.headers)
         if extra_headers:
             headers.update(extra_headers)
 
         # ленивый логин один раз перед первым вызовом
+        generation = self._login_generation
         if not self._logged_in:
-            await self._login()
+            await self._login(generation)
+            generation = self._login_generation
 
-        response = await self._client.request(method, url, json=json_body, headers=headers)
+        response = await self._client.request(
+            method, url, json=json_body, headers=headers, timeout=self._timeout
+        )
         # если сессия протухла/редирект на логин — пробуем залогиниться и повторить 1 раз
         if response.status_code in (401, 403, 302, 307):
-            await self._login()
-            response = await self._client.request(method, url, json=json_body, headers=headers)
+            await self._login(generation)
+            response = await self._client.request(
+                method, url, json=json_body, headers=headers, timeout=self._timeout
+            )
         return response
 
+    def _compile(self, request_def: Mapping[str, Any]) -> CompiledRequest:
+        return CompiledRequest(
+            method=request_def.get("method", "GET"),
+            url_template=self._substitute_env(_raw_url(request_def)),
+            headers=tuple(
+                (header["key"], header.get("value", ""))
+                for header in request_def.get("header", [])
+                if header.get("key")
+            ),
+        )
+
     def _prepare_url(
         self,
-        raw_url: str,
+        url_template: str,
         path_params: Mapping[str, Any],
         query_params: Mapping[str, Any],
     ) -> str:
-        url = self._substitute_env(raw_url)
-        for key, value in path_params.items():
-            pattern = re.compile(rf"[:{{]{{1}}{re.escape(key)}[}}]?")
-            url = pattern.sub(str(value), url)
+        url = url_template
+        if path_params:
+            # один проход по шаблону вместо компиляции regex на каждый параметр
+            url = _PATH_RE.sub(
+                lambda m: str(path_params[m.group(1)]) if m.group(1) in path_params else m.group(0),
+                url,
+            )
         if query_params:
             url = self._append_query_params(url, query_params)
         return url
 
     def _substitute_env(self, raw: str) -> str:
-        result = raw
-        for key, value in self._env.items():
-            result = result.replace(f"{{{{{key}}}}}", str(value))
-        return result
+        return _ENV_RE.sub(lambda m: str(self._env.get(m.group(1), m.group(0))), raw)
 
     def _append_query_params(self, url: str, query: Mapping[str, Any]) -> str:
         separator = '&' if '?' in url else '?'
-        query_parts = []
-        for key, value in query.items():
-            if value is None:
-                continue
-            query_parts.append(f"{key}={httpx.QueryParams({key: value})[key]}")
-        return url + (separator + '&'.join(query_parts) if query_parts else '')
+        # bool — как в httpx ("true"/"false"), всё остальное через str()
+        encoded = urlencode(
+            [
+                (key, ("true" if value else "false") if isinstance(value, bool) else value)
+                for key, value in query.items()
+                if value is not None
+            ],
+            quote_via=quote,
+        )
+        return url + (separator + encoded if encoded else '')
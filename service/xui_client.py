@@ -1,12 +1,66 @@
 # service/xui_client.py
 from __future__ import annotations
 import asyncio
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Dict, Optional, Tuple
 
 import httpx
+import orjson
 from httpx import Response
 
 
+# Панель одна, а запросы к ней идут пачками на всплесках выдачи ключей:
+# держим тёплые keep-alive соединения, чтобы не платить за TCP/TLS на каждый вызов.
+DEFAULT_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0)
+
+# Сколько секунд ответ /inbounds/get считается свежим для чтения
+INBOUND_CACHE_TTL = 3.0
+
+
+def _extract_clients_from_inbound(payload: dict) -> list[dict]:
+    """
+    В 3x-ui клиенты лежат в obj.settings.clients[], а obj.settings приходит строкой JSON.
+    Поддерживаем разные формы ответа (fork-и иногда заворачивают в data/obj).
+    """
+    candidates = [
+        payload,
+        payload.get("data") or {},
+        (payload.get("data") or {}).get("obj") or {},
+        payload.get("obj") or {},
+    ]
+    obj = {}
+    for c in candidates:
+        if isinstance(c, dict) and "settings" in c:
+            obj = c
+            break
+    settings_raw = obj.get("settings")
+    if settings_raw is None:
+        return []
+    if isinstance(settings_raw, str):
+        try:
+            settings_parsed = orjson.loads(settings_raw)
+        except Exception:
+            return []
+    elif isinstance(settings_raw, dict):
+        settings_parsed = settings_raw
+    else:
+        return []
+    clients = settings_parsed.get("clients") or []
+    return clients if isinstance(clients, list) else []
+
+
+def _build_client_index(clients: list[dict]) -> Dict[str, str]:
+    """email (lower) -> id первого клиента с валидным id, как при линейном поиске."""
+    index: Dict[str, str] = {}
+    for c in clients:
+        if not isinstance(c, dict):
+            continue
+        cid = c.get("id")
+        if isinstance(cid, str) and len(cid) >= 8:
+            index.setdefault(str(c.get("email", "")).lower(), cid)
+    return index
+
+
 class XuiAuthError(Exception):
     pass
 
@@ -33,31 +87,47 @@ class XuiClient:
         password: str,
         api_prefix: str = "/panel/api",
         timeout: float = 10.0,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        inbound_cache_ttl: float = INBOUND_CACHE_TTL,
+        client: Optional[httpx.AsyncClient] = None,
     ) -> None:
         self._base = base_url.rstrip("/")
         self._prefix = api_prefix.rstrip("/")
         self._username = username
         self._password = password
-        self._client = httpx.AsyncClient(
-            base_url=self._base,
-            timeout=timeout,
-            follow_redirects=False,
-        )
+        self._timeout = timeout
+        # client передают, чтобы делить пул соединений с PostmanRunner;
+        # закрывает его тогда владелец, а не мы
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(follow_redirects=False, limits=limits)
         self._login_lock = asyncio.Lock()
+        self._login_generation = 0
+        self._inbound_cache_ttl = inbound_cache_ttl
+        # inbound_id -> (момент протухания по monotonic, разобранный ответ панели, индекс email -> id клиента)
+        self._inbound_cache: Dict[int, Tuple[float, Dict[str, Any], Dict[str, str]]] = {}
 
     async def aclose(self) -> None:
-        """Закрывает httpx-клиент (нужно при завершении FastAPI)."""
-        await self._client.aclose()
+        """Закрывает httpx-клиент (нужно при завершении FastAPI), если он наш."""
+        if self._owns_client:
+            await self._client.aclose()
 
 
-    async def login(self) -> None:
-        """Выполнить логин и получить cookie session."""
+    async def login(self, *, stale_generation: Optional[int] = None) -> None:
+        """
+        Выполнить логин и получить cookie session.
+        stale_generation — номер сессии, на которой словили 401: если пока ждали лок,
+        кто-то уже перелогинился, второй POST /login не делаем.
+        """
         async with self._login_lock:
+            if stale_generation is not None and stale_generation != self._login_generation:
+                return
+            self._login_generation += 1
             # логинимся всегда по /login, независимо от префикса
             login_url = f"{self._base}/login"
             r = await self._client.post(
                 login_url,
                 json={"username": self._username, "password": self._password},
+                timeout=self._timeout,
             )
             if r.status_code != 200:
                 raise XuiAuthError(f"login failed: {r.status_code} {r.text}")
@@ -75,16 +145,43 @@ class XuiClient:
         json: Any = None,
     ) -> Response:
         """Один ретрай при 401: relogin() + повтор."""
-        url = f"{self._prefix}{path}"
-        r = await self._client.request(method, url, params=params, json=json)
+        url = f"{self._base}{self._prefix}{path}"
+        generation = self._login_generation
+        r = await self._client.request(method, url, params=params, json=json, timeout=self._timeout)
         if r.status_code == 401:
-            await self.login()
-            r = await self._client.request(method, url, params=params, json=json)
+            # при протухшей сессии 401 ловят все параллельные запросы — логинится только первый
+            await self.login(stale_generation=generation)
+            r = await self._client.request(method, url, params=params, json=json, timeout=self._timeout)
         return r
 
     # ====== Обёртки по API панели ======
 
-    async def get_inbound(self, inbound_id: int) -> Dict[str, Any]:
+    def has_cached_inbound(self, inbound_id: int) -> bool:
+        """Отдаст ли get_inbound без fresh ответ из кэша, не ходя в панель."""
+        cached = self._inbound_cache.get(inbound_id)
+        return bool(cached and cached[0] > time.monotonic())
+
+    def invalidate_inbound(self, inbound_id: int) -> None:
+        """Сбросить закэшированный инбаунд — после любых правок его клиентов, в том числе мимо XuiClient."""
+        self._inbound_cache.pop(inbound_id, None)
+
+    async def get_inbound(self, inbound_id: int, *, fresh: bool = False) -> Dict[str, Any]:
+        """
+        Инбаунд со списком клиентов. Без fresh ответ может быть из кэша (до INBOUND_CACHE_TTL секунд) —
+        этого хватает для поиска клиента; перед записью settings нужно читать с fresh=True.
+        Возвращаемый dict общий с кэшем — не изменять.
+        """
+        payload, _ = await self.get_inbound_with_index(inbound_id, fresh=fresh)
+        return payload
+
+    async def get_inbound_with_index(
+        self, inbound_id: int, *, fresh: bool = False
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """То же, что get_inbound, плюс индекс email (lower) -> id клиента; строится один раз на ответ панели."""
+        if not fresh:
+            cached = self._inbound_cache.get(inbound_id)
+            if cached and cached[0] > time.monotonic():
+                return cached[1], cached[2]
         r = await self._request("GET", f"/inbounds/get/{inbound_id}")
         if r.status_code == 404:
             raise XuiNotFound(f"Inbound {inbound_id} not found")
@@ -92,7 +189,10 @@ class XuiClient:
             r.raise_for_status()
         except httpx.HTTPStatusError as e:
             raise XuiBadResponse(f"get_inbound failed: {e.response.status_code} {e.response.text}") from e
-        return r.json()
+        payload = orjson.loads(r.content)
+        index = _build_client_index(_extract_clients_from_inbound(payload))
+        self._inbound_cache[inbound_id] = (time.monotonic() + self._inbound_cache_ttl, payload, index)
+        return payload, index
 
     async def list_inbounds(self) -> Dict[str, Any]:
         r = await self._request("GET", "/inbounds/list")
@@ -100,7 +200,7 @@ class XuiClient:
             r.raise_for_status()
         except httpx.HTTPStatusError as e:
             raise XuiBadResponse(f"list_inbounds failed: {e.response.status_code} {e.response.text}") from e
-        return r.json()
+        return orjson.loads(r.content)
 
     async def update_inbound_settings(self, inbound_id: int, settings_dict: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -108,15 +208,17 @@ class XuiClient:
         В большинстве сборок 3x-ui действует POST /panel/api/inbounds/update
         с телом: {"id": <inbound_id>, "settings": "<json-string>"}
         """
-        import json as _json  # локальный импорт, чтобы не тянуть наверх
+        # панель ждёт settings строкой; orjson пишет UTF-8 как есть — как json.dumps(ensure_ascii=False)
         payload = {
             "id": inbound_id,
-            "settings": _json.dumps(settings_dict, ensure_ascii=False),
+            "settings": orjson.dumps(settings_dict).decode(),
         }
+        # что бы ни ответила панель, закэшированный список клиентов уже не годится
+        self.invalidate_inbound(inbound_id)
         r = await self._request("POST", "/inbounds/update", json=payload)
         try:
             r.raise_for_status()
         except httpx.HTTPStatusError as e:
             # Некоторые форки возвращают 200/400 с полезным текстом — отдаём как есть
             raise XuiBadResponse(f"update_inbound_settings failed: {e.response.status_code} {e.response.text}") from e
-        return r.json()
+        return orjson.loads(r.content)
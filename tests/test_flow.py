@@ -1,14 +1,16 @@
 import json
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
+import httpx
 import pytest
 from httpx import ASGITransport, AsyncClient
 
 os.environ.setdefault("SERVICE_HMAC_SECRET", "test_secret")
 
-from service.app import app, settings  # noqa: E402
+from service.app import MAX_BODY_BYTES, app, settings  # noqa: E402
 from service.security import make_signature  # noqa: E402
+from service.xui_client import XuiClient  # noqa: E402
 
 
 class MockResponse:
@@ -16,6 +18,10 @@ class MockResponse:
         self.status_code = status_code
         self._payload = payload
 
+    @property
+    def content(self) -> bytes:
+        return json.dumps(self._payload).encode("utf-8")
+
     def json(self) -> Dict[str, Any]:
         return self._payload
 
@@ -99,5 +105,195 @@ async def test_issue_flow() -> None:
         assert response.status_code == 200
         assert response.json()["delivery"]["uri"] == "vless://example"
 
+        # Replay with the same key is served from the cache without touching the runner
+        calls_before = len(mock_runner.calls)
+        headers = sign_headers(body)
+        headers["Idempotency-Key"] = "test-key"
+        response = await client.post("/api/v1/keys/issue", content=body, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["action"] == "created"
+        assert len(mock_runner.calls) == calls_before
+
         assert mock_runner.calls.count(settings.postman_mapping["find_by_user"]) >= 2
         assert settings.postman_mapping["create_for_user"] in mock_runner.calls
+
+
+class FakeXui:
+    def __init__(self) -> None:
+        self.clients: List[Dict[str, Any]] = [{"id": "11111111-aaaa", "email": "known@routex"}]
+        self.updates = 0
+
+    async def get_inbound(self, inbound_id: int, *, fresh: bool = False) -> Dict[str, Any]:
+        return {"obj": {"settings": json.dumps({"clients": list(self.clients)})}}
+
+    async def get_inbound_with_index(
+        self, inbound_id: int, *, fresh: bool = False
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        index = {c["email"]: c["id"] for c in self.clients}
+        return await self.get_inbound(inbound_id, fresh=fresh), index
+
+    def has_cached_inbound(self, inbound_id: int) -> bool:
+        return False
+
+    async def update_inbound_settings(self, inbound_id: int, settings_dict: Dict[str, Any]) -> Dict[str, Any]:
+        self.updates += 1
+        self.clients = settings_dict["clients"]
+        return {"success": True}
+
+
+@pytest.mark.asyncio
+async def test_key_by_email_reuses_or_creates_client() -> None:
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        xui = FakeXui()
+        app.state.xui = xui
+        try:
+            response = await client.get(
+                "/api/v1/keys/by-user",
+                params={"inbound_id": 1, "email": "Known@routex"},
+                headers=sign_headers(b""),
+            )
+            assert response.status_code == 200
+            assert response.json()["action"] == "existing"
+            assert response.json()["client"]["panel_user_id"] == "11111111-aaaa"
+            uri = response.json()["delivery"]["uri"]
+            assert uri.startswith("vless://11111111-aaaa@") and uri.endswith("#known%40routex")
+
+            response = await client.get(
+                "/api/v1/keys/by-user",
+                params={"inbound_id": 1, "email": "new@routex"},
+                headers=sign_headers(b""),
+            )
+            assert response.status_code == 200
+            assert response.json()["action"] == "created"
+            assert xui.updates == 1
+            assert [c["email"] for c in xui.clients] == ["known@routex", "new@routex"]
+        finally:
+            app.state.xui = None
+
+
+class FakePanel:
+    """3x-ui panel behind httpx.MockTransport, recording every request it gets."""
+
+    def __init__(self) -> None:
+        self.clients: List[Dict[str, Any]] = [{"id": "11111111-aaaa", "email": "known@routex"}]
+        self.calls: List[str] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/login"):
+            return httpx.Response(200, json={"success": True})
+        self.calls.append(request.method)
+        if request.url.path.endswith("/inbounds/update"):
+            self.clients[:] = json.loads(json.loads(request.content)["settings"])["clients"]
+            return httpx.Response(200, json={"success": True})
+        settings_json = json.dumps({"clients": list(self.clients)})
+        return httpx.Response(200, json={"success": True, "obj": {"id": 1, "settings": settings_json}})
+
+
+class RevokingRunner:
+    """Deletes the client straight in the panel, the way the Postman collection does."""
+
+    def __init__(self, panel: FakePanel) -> None:
+        self.panel = panel
+
+    async def call(self, name: str, **kwargs: Any) -> MockResponse:
+        assert name == settings.postman_mapping["revoke_by_user"]
+        self.panel.clients.clear()
+        return MockResponse(200, {"success": True})
+
+
+@pytest.mark.asyncio
+async def test_revoke_invalidates_cached_inbound() -> None:
+    panel = FakePanel()
+    http = httpx.AsyncClient(transport=httpx.MockTransport(panel))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        app.state.xui = XuiClient("http://panel", "admin", "secret", client=http)
+        app.state.postman_runner = RevokingRunner(panel)
+        try:
+            params = {"inbound_id": 1, "email": "known@routex"}
+            response = await client.get("/api/v1/keys/by-user", params=params, headers=sign_headers(b""))
+            assert response.json()["action"] == "existing"
+
+            body = json.dumps({"tg_user_id": 1, "inbound_id": 1}).encode("utf-8")
+            response = await client.post("/api/v1/keys/revoke", content=body, headers=sign_headers(body))
+            assert response.status_code == 200
+
+            # Without invalidation the revoked key would still be served as existing from the cache
+            panel.calls.clear()
+            response = await client.get("/api/v1/keys/by-user", params=params, headers=sign_headers(b""))
+            assert response.json()["action"] == "created"
+            # Cold cache: the first read is already fresh, no second GET before the update
+            assert panel.calls == ["GET", "POST", "GET"]
+        finally:
+            app.state.xui = None
+            await http.aclose()
+
+
+@pytest.mark.asyncio
+async def test_new_client_on_warm_cache_rereads_before_update() -> None:
+    panel = FakePanel()
+    http = httpx.AsyncClient(transport=httpx.MockTransport(panel))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        app.state.xui = XuiClient("http://panel", "admin", "secret", client=http)
+        try:
+            params = {"inbound_id": 1, "email": "known@routex"}
+            response = await client.get("/api/v1/keys/by-user", params=params, headers=sign_headers(b""))
+            assert response.json()["action"] == "existing"
+
+            # Someone else adds a client while the inbound sits in the cache
+            panel.clients.append({"id": "22222222-bbbb", "email": "other@routex"})
+            panel.calls.clear()
+            params = {"inbound_id": 1, "email": "new@routex"}
+            response = await client.get("/api/v1/keys/by-user", params=params, headers=sign_headers(b""))
+            assert response.json()["action"] == "created"
+            assert panel.calls == ["GET", "POST", "GET"]
+            assert [c["email"] for c in panel.clients] == ["known@routex", "other@routex", "new@routex"]
+        finally:
+            app.state.xui = None
+            await http.aclose()
+
+
+@pytest.mark.asyncio
+async def test_oversized_body_is_rejected_before_signature_check() -> None:
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        # Bad signature still gets 413, not 401: size is checked before the signature
+        body = json.dumps({"tg_user_id": 1, "inbound_id": 1, "reason": "x" * MAX_BODY_BYTES}).encode("utf-8")
+        response = await client.post("/api/v1/keys/revoke", content=body, headers={"X-Signature": "bad"})
+        assert response.status_code == 413
+        assert response.json()["error"]["code"] == "payload_too_large"
+
+        # A declared Content-Length alone is enough, the body is not read
+        response = await client.post(
+            "/api/v1/keys/revoke", content=b"{}", headers={"Content-Length": str(MAX_BODY_BYTES + 1)}
+        )
+        assert response.status_code == 413
+
+        # Chunked upload without Content-Length is cut off at the first chunk past the limit
+        pulled: List[int] = []
+
+        async def chunks():
+            for _ in range(8):
+                pulled.append(1)
+                assert len(pulled) <= 3, "body was read past the limit"
+                yield b"x" * (MAX_BODY_BYTES // 2)
+
+        response = await client.post("/api/v1/keys/revoke", content=chunks())
+        assert response.status_code == 413
+        assert len(pulled) == 3
+
+
+@pytest.mark.asyncio
+async def test_invalid_body_is_rejected_after_signature_check() -> None:
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        body = b'{"tg_user_id": "not-a-number", "inbound_id": 1}'
+        response = await client.post("/api/v1/keys/revoke", content=body, headers={"X-Signature": "bad"})
+        assert response.status_code == 401
+
+        response = await client.post("/api/v1/keys/revoke", content=body, headers=sign_headers(body))
+        assert response.status_code == 422
+        assert response.json()["error"]["code"] == "validation_error"
+        assert "tg_user_id" in response.json()["error"]["message"]
@@ -34,3 +34,22 @@ def test_hmac_invalid_signature() -> None:
 
     with pytest.raises(SignatureError):
         verify_hmac(headers, body, secret=secret)
+
+
+def test_hmac_signature_accepts_pre_encoded_secret() -> None:
+    body = b'{"hello":"world"}'
+    timestamp = str(int(time.time()))
+
+    assert make_signature(b"secret", timestamp, "nonce", body) == make_signature("secret", timestamp, "nonce", body)
+
+
+def test_hmac_verification_accepts_pre_encoded_secret() -> None:
+    body = b"{}"
+    timestamp = str(int(time.time()))
+    headers = {
+        "X-Timestamp": timestamp,
+        "X-Nonce": "nonce",
+        "X-Signature": make_signature("secret", timestamp, "nonce", body),
+    }
+
+    verify_hmac(headers, body, secret=b"secret")
@@ -0,0 +1,58 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from service.postman_runner import PostmanRunner
+
+
+def make_runner(tmp_path: Path) -> PostmanRunner:
+    collection = {
+        "item": [
+            {
+                "name": "Inbounds",
+                "item": [
+                    {
+                        "name": "Get Inbound",
+                        "request": {
+                            "method": "GET",
+                            "url": {"raw": "http://{{HOST}}:{{PORT}}/panel/api/inbounds/get/{inboundId}"},
+                        },
+                    }
+                ],
+            }
+        ]
+    }
+    environment = {"values": [{"key": "HOST", "value": "panel"}, {"key": "PORT", "value": "2053"}]}
+    collection_path = tmp_path / "collection.json"
+    environment_path = tmp_path / "environment.json"
+    collection_path.write_text(json.dumps(collection), encoding="utf-8")
+    environment_path.write_text(json.dumps(environment), encoding="utf-8")
+    return PostmanRunner(collection_path, environment_path=environment_path)
+
+
+@pytest.mark.asyncio
+async def test_prepare_url_substitutes_env_and_path_params(tmp_path: Path) -> None:
+    runner = make_runner(tmp_path)
+    try:
+        compiled = runner._requests["Get Inbound"]
+        assert compiled.method == "GET"
+        template = compiled.url_template
+        assert template == "http://panel:2053/panel/api/inbounds/get/{inboundId}"
+        assert runner._prepare_url(template, {"inboundId": 7}, {}) == "http://panel:2053/panel/api/inbounds/get/7"
+    finally:
+        await runner.aclose()
+
+
+@pytest.mark.asyncio
+async def test_prepare_url_encodes_query_and_skips_none(tmp_path: Path) -> None:
+    runner = make_runner(tmp_path)
+    try:
+        url = runner._prepare_url(
+            "http://panel/find",
+            {},
+            {"tg_user_id": 1, "email": "a b@routex", "active": True, "inbound_id": None},
+        )
+        assert url == "http://panel/find?tg_user_id=1&email=a%20b%40routex&active=true"
+    finally:
+        await runner.aclose()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+
+from bot.sender import RateLimitedSender
+
+
+@pytest.mark.asyncio
+async def test_sender_spaces_messages_within_chat() -> None:
+    sender = RateLimitedSender(chat_interval=0.05, global_rate=1000)
+    sent_at: List[float] = []
+
+    async def record() -> None:
+        sent_at.append(time.monotonic())
+
+    await asyncio.gather(sender.send(1, record), sender.send(1, record))
+    assert sent_at[1] - sent_at[0] >= 0.045
+
+
+@pytest.mark.asyncio
+async def test_sender_does_not_delay_other_chats() -> None:
+    sender = RateLimitedSender(chat_interval=10, global_rate=1000)
+    started = time.monotonic()
+
+    async def noop() -> None:
+        return None
+
+    await asyncio.gather(*(sender.send(chat_id, noop) for chat_id in range(5)))
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.asyncio
+async def test_sender_retries_after_flood_control() -> None:
+    sender = RateLimitedSender(chat_interval=0, global_rate=1000)
+    calls: List[int] = []
+
+    async def flaky() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="flood", retry_after=0)
+        return "ok"
+
+    assert await sender.send(1, flaky) == "ok"
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_sender_backs_off_on_network_errors_but_not_forbidden() -> None:
+    sender = RateLimitedSender(chat_interval=0, global_rate=1000, backoff_initial=0.01, backoff_max=0.01)
+    calls: List[int] = []
+
+    async def flaky() -> str:
+        calls.append(1)
+        if len(calls) < 3:
+            raise TelegramNetworkError(method=None, message="timeout")
+        return "ok"
+
+    assert await sender.send(1, flaky) == "ok"
+    assert len(calls) == 3
+
+    async def blocked() -> None:
+        calls.append(1)
+        raise TelegramForbiddenError(method=None, message="blocked")
+
+    calls.clear()
+    with pytest.raises(TelegramForbiddenError):
+        await sender.send(1, blocked)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_flood_control_in_one_chat_does_not_pause_others() -> None:
+    sender = RateLimitedSender(chat_interval=0, global_rate=1000)
+    calls: List[int] = []
+
+    async def flooded() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=None, message="flood", retry_after=10)
+        return "ok"
+
+    async def noop() -> None:
+        return None
+
+    flooded_task = asyncio.ensure_future(sender.send(1, flooded))
+    await asyncio.sleep(0)
+    started = time.monotonic()
+    await sender.send(2, noop)
+    assert time.monotonic() - started < 1
+    flooded_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flooded_task
@@ -0,0 +1,30 @@
+import asyncio
+import gc
+
+import pytest
+
+from bot.handlers.keys import UserLockManager
+
+
+@pytest.mark.asyncio
+async def test_user_lock_serializes_same_user() -> None:
+    manager = UserLockManager()
+    events = []
+
+    async def worker(name: str) -> None:
+        async with manager.lock(1):
+            events.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            events.append(f"{name}:end")
+
+    await asyncio.gather(worker("a"), worker("b"))
+    assert events == ["a:start", "a:end", "b:start", "b:end"]
+
+
+@pytest.mark.asyncio
+async def test_user_lock_is_dropped_when_idle() -> None:
+    manager = UserLockManager()
+    async with manager.lock(1):
+        assert 1 in manager._locks
+    gc.collect()
+    assert 1 not in manager._locks
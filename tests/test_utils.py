@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pytest
+
+from bot.utils import ensure_png_bytes, load_yaml_config
+
+
+def _write_config(path: Path, body: str) -> Path:
+    path.write_text(body, encoding="utf-8")
+    return path
+
+
+def test_config_prebuilds_messages(tmp_path: Path) -> None:
+    path = _write_config(
+        tmp_path / "config.yaml",
+        "links:\n"
+        "  android_client_url: https://example.com/android\n"
+        "  browser_ext_url: https://example.com/ext.zip\n"
+        "  browser_ext_guide_url: https://example.com/guide\n"
+        "texts:\n"
+        "  help_common: tips\n"
+        "  browser_ext_install: steps\n",
+    )
+    config = load_yaml_config(path)
+
+    assert config.link_messages["browser:link"] == "🌍 Расширение\nhttps://example.com/ext.zip"
+    assert config.link_messages["browser:guide"] == "📘 Инструкция\nsteps\n\nПодробности: https://example.com/guide"
+    assert config.link_messages["help:android"] == "📱 Android\nhttps://example.com/android\n\nСоветы:\ntips"
+    assert config.link_messages["help:ios"].startswith("🍏 iOS\nСсылка не настроена.")
+    assert config.help_faq_msg == "❓ Общие советы\ntips"
+
+
+def test_config_is_cached_by_path(tmp_path: Path) -> None:
+    path = _write_config(tmp_path / "config.yaml", "links: {}\n")
+    assert load_yaml_config(path) is load_yaml_config(path)
+
+
+@pytest.mark.asyncio
+async def test_qr_png_is_rendered_once_per_uri() -> None:
+    first = await ensure_png_bytes(None, "vless://cached@example")
+    second = await ensure_png_bytes(None, "vless://cached@example")
+
+    assert first.startswith(b"\x89PNG")
+    assert first is second
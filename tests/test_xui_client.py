@@ -0,0 +1,80 @@
+import asyncio
+from typing import List
+
+import httpx
+import pytest
+
+from service.xui_client import XuiClient
+
+
+def make_client(http: httpx.AsyncClient) -> XuiClient:
+    return XuiClient("http://panel", "admin", "secret", client=http)
+
+
+@pytest.mark.asyncio
+async def test_get_inbound_is_cached_until_update() -> None:
+    calls: List[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        return httpx.Response(200, json={"obj": {"settings": '{"clients": []}'}})
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = make_client(http)
+    try:
+        await client.get_inbound(1)
+        await client.get_inbound(1)
+        assert calls.count("/panel/api/inbounds/get/1") == 1
+
+        await client.get_inbound(1, fresh=True)
+        assert calls.count("/panel/api/inbounds/get/1") == 2
+
+        await client.update_inbound_settings(1, {"clients": []})
+        await client.get_inbound(1)
+        assert calls.count("/panel/api/inbounds/get/1") == 3
+    finally:
+        await client.aclose()
+        await http.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_401s_trigger_single_relogin() -> None:
+    logins: List[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        if request.url.path == "/login":
+            logins.append(1)
+            return httpx.Response(200, json={"success": True})
+        if not logins:
+            return httpx.Response(401)
+        return httpx.Response(200, json={"obj": {}})
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = make_client(http)
+    try:
+        await asyncio.gather(*(client.get_inbound(1, fresh=True) for _ in range(5)))
+        assert len(logins) == 1
+    finally:
+        await client.aclose()
+        await http.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_index_is_cached_with_inbound() -> None:
+    settings = '{"clients": [{"id": "11111111-aaaa", "email": "Known@routex"}, {"id": "short", "email": "bad@routex"}]}'
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"obj": {"settings": settings}})
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = make_client(http)
+    try:
+        payload, index = await client.get_inbound_with_index(1)
+        assert index == {"known@routex": "11111111-aaaa"}
+
+        cached_payload, cached_index = await client.get_inbound_with_index(1)
+        assert cached_payload is payload and cached_index is index
+    finally:
+        await client.aclose()
+        await http.aclose()